@@ -0,0 +1,266 @@
+""" Statistical equivalence harness for alternative engines and spatial indexes
+    Runs the reference engine (world objects on SimPy) and any other engine over
+    many independent seeds, checks that the distributions of the results are
+    within equivalence margins of each other, and reports the speed of every
+    engine next to it.
+
+    An engine is any callable taking a config (see headless.make_config) and
+    returning (summary, series) like headless.simulate.
+"""
+import math
+import random
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+import headless
+from spatialhash import PersonSpatialHash
+
+# scalar results of a run which are compared across engines
+METRICS = ("peak_infected_percent", "peak_step", "attack_rate", "final_infected_percent",
+           "mean_infected_percent")
+
+
+def ks_2samp(sample_1, sample_2):
+    """Two sample Kolmogorov-Smirnov test, returns (statistic, p value).
+    Uses the asymptotic distribution, good enough from around 10 samples each
+    """
+    sample_1 = np.sort(np.asarray(sample_1, dtype=float))
+    sample_2 = np.sort(np.asarray(sample_2, dtype=float))
+    n_1, n_2 = len(sample_1), len(sample_2)
+    pooled = np.concatenate([sample_1, sample_2])
+    cdf_1 = np.searchsorted(sample_1, pooled, side="right") / float(n_1)
+    cdf_2 = np.searchsorted(sample_2, pooled, side="right") / float(n_2)
+    statistic = float(np.max(np.abs(cdf_1 - cdf_2)))
+    if statistic == 0:
+        return 0.0, 1.0
+    effective_n = math.sqrt(n_1 * n_2 / float(n_1 + n_2))
+    lambda_ = (effective_n + 0.12 + 0.11/effective_n) * statistic
+    # Kolmogorov distribution tail
+    p_value = 2 * sum((-1)**(k-1) * math.exp(-2 * k**2 * lambda_**2) for k in range(1, 101))
+    return statistic, min(max(p_value, 0.0), 1.0)
+
+
+def spatialhash_engine(spatialhash_class):
+    """Reference engine with a different spatial index plugged into the community"""
+    def engine(config):
+        return headless.simulate(config, spatialhash_class=spatialhash_class)
+    return engine
+
+
+def run_engine(engine, config, seeds):
+    """Runs an engine for every seed, returns (metrics, curves, seconds per run)"""
+    metrics = {metric: [] for metric in METRICS}
+    curves = []
+    begin_time = time.perf_counter()
+    for seed in seeds:
+        summary, series = engine(headless.make_config(**dict(config, seed=seed)))
+        series = np.asarray(series, dtype=float)
+        summary = dict(summary, mean_infected_percent=float(series.mean()))
+        for metric in METRICS:
+            metrics[metric].append(summary[metric])
+        curves.append(series)
+    seconds_per_run = (time.perf_counter() - begin_time) / len(seeds)
+    return metrics, np.array(curves), seconds_per_run
+
+
+def dkw_epsilon(num_samples, alpha):
+    """Dvoretzky-Kiefer-Wolfowitz bound: the empirical CDF of num_samples samples is
+    within this distance of the true CDF everywhere, with probability 1 - alpha
+    """
+    return math.sqrt(math.log(2 / alpha) / (2 * num_samples))
+
+
+def ks_upper_bound(sample_1, sample_2, alpha):
+    """Upper confidence bound (level 1 - alpha) on the KS distance between the true
+    distributions of two independent samples
+    """
+    statistic, _ = ks_2samp(sample_1, sample_2)
+    return statistic + dkw_epsilon(len(sample_1), alpha/2) + dkw_epsilon(len(sample_2), alpha/2)
+
+
+def curve_gap_upper_bound(curves_1, curves_2, alpha):
+    """Upper confidence bound (level 1 - alpha, simultaneous over all steps) on the
+    largest gap between the expected infected percent curves of two independent samples
+    """
+    gap = np.abs(curves_1.mean(axis=0) - curves_2.mean(axis=0))
+    standard_error = np.sqrt(curves_1.var(axis=0, ddof=1) / len(curves_1)
+                             + curves_2.var(axis=0, ddof=1) / len(curves_2))
+    # Bonferroni over the steps, two sided
+    z_value = NormalDist().inv_cdf(1 - alpha / (2 * curves_1.shape[1]))
+    return float(np.max(gap + z_value * standard_error))
+
+
+# a dense community over a few steps, the epidemic is already well under way but a run
+# only takes a few ms, so recommended_seeds() runs of it take about a minute per engine
+SMALL_CONFIG = {"boundaries": ((0, 25), (0, 25)), "num_people": 100, "steps": 10,
+                "infect_probability": 0.1, "num_popular_places": 2}
+NUM_CHECKS = len(METRICS) + 1  # every metric and the curves
+KS_MARGIN = 0.1
+CURVE_MARGIN = 2.0  # percentage points
+ALPHA = 0.05
+
+
+def recommended_seeds(ks_margin=KS_MARGIN, alpha=ALPHA):
+    """Number of seeds per engine for which the DKW slack of ks_upper_bound is half of
+    ks_margin, leaving the other half for the observed KS statistic
+    """
+    check_alpha = alpha / NUM_CHECKS
+    # 2 * dkw_epsilon(n, check_alpha / 2) <= ks_margin / 2
+    return int(math.ceil(8 * math.log(4 / check_alpha) / ks_margin**2))
+
+
+def compare_engines(engines, config=None, seeds=None, seed_offset=1000000, alpha=ALPHA,
+                    ks_margin=KS_MARGIN, curve_margin=CURVE_MARGIN, reference=headless.simulate):
+    """Compares every engine in the engines dict (name -> engine) with the reference.
+
+    The reference runs on seeds and every engine on the same seeds shifted by
+    seed_offset, so the samples are independent. An engine is faithful when, with
+    confidence 1 - alpha over all the checks together (Bonferroni):
+        - the KS distance of every metric's distribution is at most ks_margin
+        - the expected infected percent curves are never more than curve_margin apart
+    Failing to tell the engines apart is not enough, the bounds have to be small,
+    so too few seeds gives an unfaithful verdict rather than a false faithful one.
+
+    The default margins say what faithful means for this model: a KS distance of
+    0.1 is about the size of the sampling noise between two batches of a few hundred
+    runs, and 2 points is two people in the default community of 100. An engine that is
+    20% more infectious misses both by a wide margin (around 0.2 and 6 points).
+    seeds defaults to range(recommended_seeds(ks_margin, alpha)), about 5000 for the
+    default margins; fewer seeds can not get the bounds under the margins.
+
+    Returns a dict of name -> report, the reference is included under "reference".
+    """
+    if config is None:
+        config = {}
+    if seeds is None:
+        seeds = range(recommended_seeds(ks_margin, alpha))
+    seeds = list(seeds)
+    candidate_seeds = [seed + seed_offset for seed in seeds]
+    if set(seeds) & set(candidate_seeds):
+        raise ValueError("seed_offset must make the candidate seeds disjoint from the reference seeds")
+    num_checks = NUM_CHECKS
+    check_alpha = alpha / num_checks
+
+    ref_metrics, ref_curves, ref_time = run_engine(reference, config, seeds)
+    reports = {"reference": {"seconds_per_run": ref_time, "speedup": 1.0,
+                             "faithful": True, "tests": {}, "max_mean_curve_gap": 0.0,
+                             "curve_gap_bound": 0.0}}
+    for name, engine in engines.items():
+        metrics, curves, seconds_per_run = run_engine(engine, config, candidate_seeds)
+        tests = {}
+        for metric in METRICS:
+            statistic, p_value = ks_2samp(ref_metrics[metric], metrics[metric])
+            tests[metric] = {"statistic": statistic,
+                             "p_value": min(1.0, p_value * num_checks),  # Bonferroni adjusted
+                             "upper_bound": ks_upper_bound(ref_metrics[metric], metrics[metric],
+                                                           check_alpha)}
+        curve_gap_bound = curve_gap_upper_bound(ref_curves, curves, check_alpha)
+        reports[name] = {
+            "seconds_per_run": seconds_per_run,
+            "speedup": ref_time / seconds_per_run if seconds_per_run else float("inf"),
+            "faithful": (all(test["upper_bound"] <= ks_margin for test in tests.values())
+                         and curve_gap_bound <= curve_margin),
+            "tests": tests,
+            # largest difference between the average infected percent curves
+            "max_mean_curve_gap": float(np.max(np.abs(ref_curves.mean(axis=0)
+                                                      - curves.mean(axis=0)))),
+            "curve_gap_bound": curve_gap_bound,
+        }
+    return reports
+
+
+class _Point():
+    """Stand-in for a Person, spatial indexes only need a position"""
+    def __init__(self, x, y):
+        self.position = (x, y)
+
+
+def compare_spatial_index(index_class, reference_class=PersonSpatialHash, cell_size=3,
+                          num_points=1000, num_queries=500, size=100, half_range=2, seed=0):
+    """Checks neighbor queries of an index against the reference index and brute force.
+
+    Person.wander tries to infect every candidate search_nearby returns, without
+    checking the distance, so an index is only faithful if it returns exactly the
+    same people as the reference index (in any order), extra candidates included.
+    Points are moved between queries to exercise updateObject. Points inside the
+    query box that an index does not return are also counted as misses.
+    """
+    rng = random.Random(seed)
+    points = [_Point(rng.uniform(0, size), rng.uniform(0, size)) for _ in range(num_points)]
+    indexes = {"reference": reference_class(cell_size=cell_size),
+               "candidate": index_class(cell_size=cell_size)}
+    for index in indexes.values():
+        for point in points:
+            index.insertObject(point)
+    report = {name: {"misses": 0, "returned": 0, "seconds": 0.0} for name in indexes}
+    mismatches = 0
+    for _ in range(num_queries):
+        moved = rng.choice(points)
+        new_x, new_y = rng.uniform(0, size), rng.uniform(0, size)
+        for index in indexes.values():
+            index.updateObject(moved, new_x, new_y)
+        moved.position = new_x, new_y
+
+        query = rng.choice(points)
+        x, y = query.position
+        expected = {id(point) for point in points
+                    if abs(point.position[0] - x) <= half_range
+                    and abs(point.position[1] - y) <= half_range}
+        found = {}
+        for name, index in indexes.items():
+            begin_time = time.perf_counter()
+            result = index.search_nearby(query, half_range)
+            report[name]["seconds"] += time.perf_counter() - begin_time
+            found[name] = sorted(id(point) for point in result)
+            report[name]["misses"] += len(expected - set(found[name]))
+            report[name]["returned"] += len(result)
+        if found["reference"] != found["candidate"]:
+            mismatches += 1
+    report["mismatch_rate"] = mismatches / float(num_queries)
+    report["faithful"] = mismatches == 0
+    return report
+
+
+def format_report(reports):
+    """Readable table of compare_engines output"""
+    lines = ["{:<20}{:>12}{:>10}{:>10}{:>12}{:>12}  {}".format(
+        "engine", "s/run", "speedup", "faithful", "curve gap", "gap bound",
+        "max KS bound (metric)")]
+    for name, report in reports.items():
+        if report["tests"]:
+            worst = max(report["tests"], key=lambda metric: report["tests"][metric]["upper_bound"])
+            worst_text = "{:.3f} ({})".format(report["tests"][worst]["upper_bound"], worst)
+        else:
+            worst_text = "-"
+        lines.append("{:<20}{:>12.4f}{:>10.2f}{:>10}{:>12.2f}{:>12.2f}  {}".format(
+            name, report["seconds_per_run"], report["speedup"], str(report["faithful"]),
+            report["max_mean_curve_gap"], report["curve_gap_bound"], worst_text))
+    return "\n".join(lines)
+
+
+def main():
+    """Demo of the harness on SMALL_CONFIG. The reference engine plugged in as a
+    candidate (on its own seeds) must come out faithful, an engine 20% more infectious
+    must not. A coarser spatial hash misses no neighbors, but it returns more
+    candidates outside infect_range, so the neighbor query check flags it.
+    """
+    class CoarsePersonSpatialHash(PersonSpatialHash):
+        def __init__(self, cell_size):
+            super().__init__(cell_size * 2)
+
+    def more_infectious(config):
+        return headless.simulate(dict(config, infect_probability=config["infect_probability"] * 1.2))
+
+    reports = compare_engines({"same spatialhash": spatialhash_engine(PersonSpatialHash),
+                               "20% more infectious": more_infectious},
+                              config=SMALL_CONFIG)
+    print(format_report(reports))
+    index_report = compare_spatial_index(CoarsePersonSpatialHash)
+    print("Coarse spatialhash neighbor queries: misses {}, mismatch rate {:.3f}, faithful {}".format(
+        index_report["candidate"]["misses"], index_report["mismatch_rate"], index_report["faithful"]))
+
+
+if __name__ == "__main__":
+    main()
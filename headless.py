@@ -0,0 +1,136 @@
+""" Runs simulations without the GUI
+    Useful for reports, dashboards and parameter sweeps. Results of repeated
+    configurations are looked up in a ResultCache instead of re-simulating.
+"""
+import math
+import numbers
+import random
+
+import numpy as np
+import simpy
+
+import world
+
+# everything that decides the outcome of a run, same defaults as engine.main and render
+DEFAULT_CONFIG = {
+    "boundaries": ((0, 100), (0, 100)),
+    "num_people": 100,
+    "num_popular_places": 10,
+    "popular_places": None,  # None means randomly placed using the seed
+    "venue_capacity": None,
+    "seed": 0,
+    "steps": 1000,
+    # slider values, None walk_range means half the diagonal of the boundaries like render
+    # (resolved by make_config)
+    "walk_range": None,
+    "stop_duration": 25,
+    "popular_place_probability": 0.3,
+    "infect_range": 2,
+    "infect_probability": 0.01,
+}
+SLIDER_ATTRIBUTES = ("walk_range", "stop_duration", "popular_place_probability",
+                     "infect_range", "infect_probability")
+
+
+def _normalize(value):
+    """Canonical form of a config value: lists instead of tuples (or arrays), plain
+    Python numbers instead of numpy ones, and whole floats as ints (2.0 -> 2)
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, numbers.Integral):
+        return int(value)
+    if isinstance(value, numbers.Real):
+        value = float(value)
+        return int(value) if value.is_integer() else value
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def make_config(**kwargs):
+    """Returns the full configuration of a run, defaults filled in and every value
+    normalized, so configs describing the same run are equal (and share a cache key)
+    """
+    unknown = set(kwargs) - set(DEFAULT_CONFIG)
+    if unknown:
+        raise ValueError("Unknown config keys: {}".format(", ".join(sorted(unknown))))
+    config = dict(DEFAULT_CONFIG)
+    config.update(kwargs)
+    if config["walk_range"] is None:
+        # same as the initial value of the walk range slider in render.render_community
+        (start_x, end_x), (start_y, end_y) = config["boundaries"]
+        max_walk_range = round(math.sqrt((end_x - start_x)**2 + (end_y - start_y)**2))
+        config["walk_range"] = max_walk_range / 2
+    return {key: _normalize(value) for key, value in config.items()}
+
+
+def build_community(config, env, **community_kwargs):
+    """Creates a community from a config (see make_config), seeding the random module first.
+    Extra keyword arguments are passed on to world.Community
+    """
+    random.seed(config["seed"])
+    (start_x, end_x), (start_y, end_y) = config["boundaries"]
+    popular_places = config["popular_places"]
+    if popular_places is None:
+        popular_places = [(random.randrange(start_x, end_x), random.randrange(start_y, end_y))
+                          for _ in range(config["num_popular_places"])]
+    community = world.Community(config["boundaries"],
+                                env,
+                                no_of_people=config["num_people"],
+                                popular_places=[tuple(place) for place in popular_places],
+                                venue_capacity=config["venue_capacity"],
+                                **community_kwargs)
+    for attr_name in SLIDER_ATTRIBUTES:
+        community.set_people_attribute(attr_name, config[attr_name])
+    return community
+
+
+def summarize(community, series):
+    """Summary statistics of a finished run"""
+    total_infected = sum(int(person.infected) for person in community.population)
+    num_infecteds = sum(person.num_infected for person in community.population)
+    peak_step = int(np.argmax(series)) if len(series) else 0
+    return {"final_infected_percent": float(series[-1]) if len(series) else 0.0,
+            "peak_infected_percent": float(series[peak_step]) if len(series) else 0.0,
+            "peak_step": peak_step,
+            "attack_rate": total_infected / float(community.count),
+            "r_value": num_infecteds / float(total_infected) if total_infected else 0.0,
+            # positions as lists so a summary is the same before and after a JSON round trip
+            "venues": [dict(stats, position=list(stats["position"]))
+                       for stats in community.venues.stats()]}
+
+
+def simulate(config, **community_kwargs):
+    """Runs a configuration from scratch, returns (summary, series)
+    where series is the infected percent after every step
+    """
+    env = simpy.Environment()
+    community = build_community(config, env, **community_kwargs)
+    community.activate()
+    series = np.empty(config["steps"])
+    for step in range(config["steps"]):
+        env.run(until=env.now+1)
+        infected = sum(int(person.infected) for person in community.population)
+        series[step] = 100 * float(infected)/community.count
+    return summarize(community, series), series
+
+
+def run(config, cache=None, with_series=False):
+    """Returns (summary, series) for a configuration, series is None unless with_series.
+    If a ResultCache is given, cached results are returned without simulating.
+    """
+    config = make_config(**config)
+    if cache is not None:
+        cached = cache.get(config, with_series=with_series)
+        if cached is not None:
+            return cached
+    summary, series = simulate(config)
+    if cache is not None:
+        cache.put(config, summary, series if with_series else None)
+    return summary, (series if with_series else None)
+
+
+def sweep(configs, cache=None, with_series=False):
+    """Runs every configuration, skipping the ones already in the cache"""
+    return [run(config, cache=cache, with_series=with_series) for config in configs]
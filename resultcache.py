@@ -0,0 +1,165 @@
+""" On-disk cache of simulation results
+    Results are stored under a hash of the full run configuration and of the
+    simulation source code, so changing either one never returns stale results.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+
+# modules whose source decides the outcome of a run
+CODE_MODULES = ("world.py", "spatialhash.py", "venues.py", "headless.py")
+DEFAULT_CACHE_DIR = os.environ.get("ANDROMEDA_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "andromeda"))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MiB
+
+
+def code_version(modules=CODE_MODULES):
+    """Hash of the source of the simulation modules"""
+    digest = hashlib.sha256()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        digest.update(module.encode())
+        with open(os.path.join(base_dir, module), "rb") as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def config_key(config, version=None):
+    """Hash of a run configuration and the code version.
+    The config should come from headless.make_config, which makes it canonical
+    """
+    if version is None:
+        version = code_version()
+    canonical = json.dumps({"config": config, "code": version},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class ResultCache():
+    """
+    Content addressed cache of simulation results
+
+    Functions
+    ------------
+
+    get(config, with_series=False)
+        cached (summary, series) for config, or None. series is None if not stored
+
+    put(config, summary, series=None)
+        store the summary (and optionally the time series) of a run
+
+    Least recently used entries are evicted once the cache grows past max_bytes.
+    The size of the cache is scanned once and then kept as a running total, the
+    directory is only scanned again when that total goes over max_bytes.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.version = code_version()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = None  # running total of the cache size, None till first scanned
+
+    def _paths(self, key):
+        directory = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(directory, key + ".json"), os.path.join(directory, key + ".npz")
+
+    def key(self, config):
+        return config_key(config, self.version)
+
+    def get(self, config, with_series=False):
+        summary_path, series_path = self._paths(self.key(config))
+        try:
+            with open(summary_path) as summary_file:
+                summary = json.load(summary_file)
+            series = None
+            if with_series:
+                with np.load(series_path) as series_file:
+                    series = series_file["series"]
+            os.utime(summary_path)  # mark the entry as recently used
+        except OSError:
+            # missing, or evicted by another process while reading, either way a miss
+            # (also when only the summary is stored and the series is asked for)
+            return None
+        return summary, series
+
+    def _write(self, path, write):
+        """Writes a file through a uniquely named temporary file, so concurrent writers
+        of the same key never clash and readers never see a partial file.
+        Returns the change in the size of the cache.
+        """
+        directory = os.path.dirname(path)
+        # the .tmp suffix keeps files being written out of _entries
+        handle, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as tmp_file:
+                write(tmp_file)
+            new_size = os.path.getsize(tmp_path)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return new_size - old_size
+
+    def put(self, config, summary, series=None):
+        summary_path, series_path = self._paths(self.key(config))
+        os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+        if self._size is None:
+            self._size = self.size()
+        if series is not None:
+            # write the series first so a summary never points at a missing series
+            self._size += self._write(series_path, lambda tmp_file: np.savez_compressed(
+                tmp_file, series=np.asarray(series)))
+        self._size += self._write(summary_path, lambda tmp_file: tmp_file.write(
+            json.dumps(summary).encode()))
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def _entries(self):
+        """Returns a list of (last used time, total size, paths) for every cache entry.
+        The summary and the series of a key make up one entry, and get only touches
+        the summary, so the latest time of the two is the time of last use.
+        """
+        entries = {}
+        for directory, _, files in os.walk(self.cache_dir):
+            for name in files:
+                key, extension = os.path.splitext(name)
+                if extension not in (".json", ".npz"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue  # evicted by another process
+                last_used, size, paths = entries.get(key, (0, 0, []))
+                entries[key] = (max(last_used, stat.st_mtime), size + stat.st_size, paths + [path])
+        return list(entries.values())
+
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Removes least recently used entries (summary and series together)
+        till the cache fits in max_bytes
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, paths in entries:
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # already evicted by another process
+            total -= size
+        self._size = total
+
+    def clear(self):
+        for _, _, paths in self._entries():
+            for path in paths:
+                os.remove(path)
+        self._size = 0
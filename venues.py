@@ -0,0 +1,140 @@
+import random
+
+
+class Venue():
+    """
+    A popular place in a community
+
+    Keeps track of the people currently at the venue (occupants) and the people
+    walking towards it (heading), along with some load statistics.
+    A capacity of None means the venue can hold any number of people.
+
+    People at a venue are out of the spatial hash, so they can only infect or be
+    infected by other occupants, and that happens every step they stay there
+    (not only while moving, like everywhere else in the community).
+    occupants and heading are dicts used as ordered sets so that the random
+    draws happen in the same order on every run with the same seed.
+    """
+    def __init__(self, venue_id, position, capacity=None):
+        self.id_ = venue_id
+        self.position = position
+        self.capacity = capacity
+        self.occupants = {}  # person -> None, in order of arrival
+        self.heading = {}
+        self.visits = 0  # number of arrivals at this venue
+        self.peak_occupancy = 0
+        self.infections = 0  # number of people infected at this venue
+
+    def load(self):
+        """Number of people at or heading to the venue"""
+        return len(self.occupants) + len(self.heading)
+
+    def is_full(self):
+        if self.capacity is None:
+            return False
+        return self.load() >= self.capacity
+
+    def transmit(self):
+        """Spread the infection among the occupants of this venue.
+
+        Every susceptible occupant escapes each infected occupant independently
+        with probability 1 - infect_probability, so one draw per susceptible person
+        replaces all the pairwise checks. Called once per step for as long as the
+        occupants stay. Returns the number of new infections.
+        """
+        infected = [person for person in self.occupants if person.infected]
+        if not infected:
+            return 0
+        escape_probability = 1.0
+        for person in infected:
+            escape_probability *= 1 - person.infect_probability
+        new_infections = 0
+        for person in self.occupants:
+            if not person.infected and random.random() >= escape_probability:
+                person.got_infected()
+                # credit one of the infected occupants for the R value
+                random.choice(infected).num_infected += 1
+                new_infections += 1
+        self.infections += new_infections
+        return new_infections
+
+
+class VenueIndex():
+    """
+    Index of the popular places in a community
+
+    Functions
+    ------------
+
+    choose(person)
+        pick a venue with room for the person, and mark them as heading there
+
+    arrive(person, venue)
+        the person has reached the venue
+
+    leave(person)
+        the person has left the venue they were at or heading to
+
+    is_at_venue(person)
+        whether the person is currently at (not heading to) a venue
+
+    transmit()
+        spread the infection within every venue, once per call
+    """
+    def __init__(self, popular_places, capacity=None):
+        self.venues = [Venue(venue_id, position, capacity)
+                       for venue_id, position in enumerate(popular_places)]
+        self.venue_of = {}  # person -> venue they are at or heading to
+
+    def __len__(self):
+        return len(self.venues)
+
+    def __iter__(self):
+        return iter(self.venues)
+
+    def choose(self, person):
+        """Returns a random venue which is not full, or None if all of them are"""
+        venue = random.choice(self.venues)
+        if venue.is_full():
+            available = [venue for venue in self.venues if not venue.is_full()]
+            if not available:
+                return None
+            venue = random.choice(available)
+        venue.heading[person] = None
+        self.venue_of[person] = venue
+        return venue
+
+    def arrive(self, person, venue):
+        venue.heading.pop(person, None)
+        venue.occupants[person] = None
+        venue.visits += 1
+        venue.peak_occupancy = max(venue.peak_occupancy, len(venue.occupants))
+
+    def leave(self, person):
+        """Removes person from the venue they were at or heading to, if any"""
+        venue = self.venue_of.pop(person, None)
+        if venue is None:
+            return
+        venue.heading.pop(person, None)
+        venue.occupants.pop(person, None)
+
+    def is_at_venue(self, person):
+        """Whether person is at a venue, as opposed to heading to one or elsewhere"""
+        venue = self.venue_of.get(person)
+        return venue is not None and person in venue.occupants
+
+    def transmit(self):
+        """Spreads the infection in every venue, returns the number of new infections"""
+        return sum(venue.transmit() for venue in self.venues)
+
+    def stats(self):
+        """Per venue load statistics, helpful for plotting and reports"""
+        return [{"id": venue.id_,
+                 "position": venue.position,
+                 "capacity": venue.capacity,
+                 "occupancy": len(venue.occupants),
+                 "heading": len(venue.heading),
+                 "visits": venue.visits,
+                 "peak_occupancy": venue.peak_occupancy,
+                 "infections": venue.infections}
+                for venue in self.venues]
@@ -4,6 +4,7 @@ import numpy as np
 import simpy
 
 from spatialhash import PersonSpatialHash
+from venues import VenueIndex
 
 CLOSE_ENOUGH_THRESHOLD = 0.5
 WALK_SPEED = 1.0
@@ -24,10 +25,10 @@ class Person:
         3. Infected state, false at init
         4. Time since infection. (Needs to be handled by simpy)
         5. Boundaries of the box they are in (given at init)
-        6. List of popular places in the community with the probability of going to such places
+        6. Index of popular places (venues) in the community with the probability of going to such places
     """
 
-    def __init__(self, person_id, start_pos, boundaries, env: simpy.Environment, popular_places):
+    def __init__(self, person_id, start_pos, boundaries, env: simpy.Environment, venues: VenueIndex):
         self.id_ = person_id
         self.position = start_pos
         self.infected = False
@@ -42,7 +43,7 @@ class Person:
         self.stop_duration = 25 # same as above, but for being in one place
         self.env = env # simpy environment
         self.boundaries = boundaries  # (x_min, x_max, y_min, y_max)
-        self.popular_places = popular_places  # a list of popular places in the community
+        self.venues = venues  # index of popular places in the community
         self.popular_place_probability = 0.3  # probability of going to a popular place
 
     def activate(self, spatialhash):
@@ -69,12 +70,25 @@ class Person:
             Times out for some time before actually updating the position.
             It would be better if it moved one position per time step, instead
             of teleporting to the location.
+
+            When going to a popular place, the person leaves the spatial hash on
+            arrival and rejoins it when they next wander. While there, they are only
+            infected (or infect) through Venue.transmit, once every step of the
+            stop, and walkers passing by cannot reach them.
         """
         (start_x, end_x), (start_y, end_y) = self.boundaries
         cur_x, cur_y = self.position
 
-        if self.popular_places and random_tf(self.popular_place_probability):
-            new_x, new_y = random.choice(self.popular_places) # go to one of popular places
+        if self.venues.is_at_venue(self):
+            # leaving a popular place, get back into the spatial hash
+            spatialhash.insertObject(self)
+        self.venues.leave(self)
+
+        venue = None
+        if self.venues and random_tf(self.popular_place_probability):
+            venue = self.venues.choose(self)  # None if all popular places are full
+        if venue is not None:
+            new_x, new_y = venue.position # go to one of popular places
         else:
             # go to random location in community
             new_x = random.uniform(0, self.walk_range) + cur_x
@@ -118,6 +132,12 @@ class Person:
             self.position = cur_x, cur_y # update position in object
             yield self.env.timeout(1)
 
+        if venue is not None:
+            # reached the popular place, transmission there is handled by the venue
+            # so take this person out of the spatial hash till they leave
+            spatialhash.removeObject(self)
+            self.venues.arrive(self, venue)
+
 class Community:
     """ A community in our model world, they are represented by boxes.
         There are also isolation communities. They are rendered on the 'Canvas'
@@ -129,7 +149,8 @@ class Community:
         3. Lockdown?
     """
 
-    def __init__(self, position, env: simpy.Environment, no_of_people=60, popular_places=None):
+    def __init__(self, position, env: simpy.Environment, no_of_people=60, popular_places=None,
+                 venue_capacity=None, spatialhash_class=PersonSpatialHash):
         self.position = position  # defines boundaries of the community
         self.env = env  # SimPy environment
         self.population = []
@@ -140,17 +161,19 @@ class Community:
         if not popular_places:
             popular_places = []
         self.popular_places = popular_places
+        # keeps track of who is at each popular place, None capacity means unlimited
+        self.venues = VenueIndex(popular_places, capacity=venue_capacity)
 
         self.count = no_of_people
 
-        # initialise spatial hash table
-        self.spatialhash = PersonSpatialHash(cell_size=3)
+        # initialise spatial hash table (any index with the same interface will do)
+        self.spatialhash = spatialhash_class(cell_size=3)
 
         self.initial_infected_percent = 0.05
         for person_id in range(no_of_people):
             # randomly spawn person
             start_pos = (random.uniform(start_x, end_x), random.uniform(start_y, end_y))
-            new_person = Person(person_id, start_pos, position, env, popular_places)
+            new_person = Person(person_id, start_pos, position, env, self.venues)
             if random_tf(self.initial_infected_percent):
                 # randomly infect that person
                 new_person.got_infected()
@@ -158,6 +181,7 @@ class Community:
             self.spatialhash.insertObject(new_person) # insert to spatial hash
         self.population_processes = []  # to store the SimPy processes for each person
         # ^ this could be dict
+        self.venue_process = None  # SimPy process for transmission at popular places
 
     def get_all_positions_colors(self, normal_color, infected_color, nparray_to_fill=None):
         """Get positions of all people in the form of two separate x and y lists.
@@ -187,9 +211,17 @@ class Community:
         for person in self.population:
             setattr(person, attr_name, value)
 
+    def transmit_at_venues(self):
+        """Spreads the infection inside the popular places, once per venue per step
+        """
+        while True:
+            self.venues.transmit()
+            yield self.env.timeout(1)
+
     def activate(self):
         """Activates all the people in this community. This will not lock the thread.
         """
         for person in self.population:
             self.population_processes.append(self.env.process(person.activate(self.spatialhash)))
+        self.venue_process = self.env.process(self.transmit_at_venues())
         return self.population_processes